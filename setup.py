@@ -27,6 +27,8 @@ def setup():
     install_requirements = ["attrdict"]
     if sys.version_info[:2] < (3, 4):
         install_requirements.append("pathlib")
+    if sys.version_info[:2] < (3, 2):
+        install_requirements.append("futures")
     setup_requirements = ['six', 'setuptools>=17.1', 'setuptools_scm']
     needs_sphinx = {
         'build_sphinx',
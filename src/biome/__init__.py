@@ -2,14 +2,43 @@
 from __future__ import absolute_import
 
 import ast
+import contextlib
+import csv
+import datetime
+import fnmatch
+import functools
+import hashlib
+import json
+import mmap
 import os
 import pathlib
+import pickle
+import re
 import sys
+import tempfile
+import time
+import types
+from concurrent import futures
 
 import attrdict
 
+try:
+    from shlex import quote as _shell_quote
+except ImportError:  # pragma: no cover
+    from pipes import quote as _shell_quote
 
-__all__ = ('EnvironmentError', 'Habitat')
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    contextvars = None
+
+__all__ = (
+    'Decoder',
+    'EnvironmentError',
+    'Habitat',
+    'InterpolationError',
+    'register_decoder',
+)
 
 
 package_name = 'biome'
@@ -18,6 +47,11 @@ package_name = 'biome'
 # See http://stackoverflow.com/a/5365733/211772
 _module_ref = sys.modules[package_name]
 
+_timer = getattr(time, 'perf_counter', time.time)
+
+# Marks variables that are unset by an override
+_MISSING = object()
+
 
 def _sanitize_prefix(prefix):
     return prefix.upper().rstrip('_')
@@ -37,6 +71,635 @@ class EnvironmentError(KeyError):
                    (prefix, name.upper()))
 
 
+class InterpolationError(ValueError):
+    """Raised when variable references in a value cannot be expanded."""
+
+    @classmethod
+    def cycle(cls, keys):  # noqa: D102
+        return cls('circular variable reference: %s' % ' -> '.join(keys))
+
+    @classmethod
+    def missing(cls, key, referrer):  # noqa: D102
+        return cls('"%s" referenced by "%s" does not exist in the '
+                   'environment' % (key, referrer))
+
+
+# Matches ``${NAME}`` references, and ``$$`` escapes
+_INTERPOLATION_RE = re.compile(r'\$(?:\$|\{([A-Za-z_][A-Za-z0-9_]*)\})')
+
+
+_DURATION_UNITS = {
+    'us': 1e-6,
+    'ms': 1e-3,
+    's': 1,
+    'm': 60,
+    'h': 60 * 60,
+    'd': 60 * 60 * 24,
+    'w': 60 * 60 * 24 * 7,
+}
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(us|ms|s|m|h|d|w)')
+_DURATION_FULL_RE = re.compile(r'^(?:\d+(?:\.\d+)?(?:us|ms|s|m|h|d|w))+$')
+
+_BYTE_SIZE_UNITS = {
+    '': 1,
+    'k': 1000,
+    'm': 1000 ** 2,
+    'g': 1000 ** 3,
+    't': 1000 ** 4,
+    'p': 1000 ** 5,
+    'ki': 1024,
+    'mi': 1024 ** 2,
+    'gi': 1024 ** 3,
+    'ti': 1024 ** 4,
+    'pi': 1024 ** 5,
+}
+_BYTE_SIZE_RE = re.compile(r'^(\d+(?:\.\d+)?)\s*([kmgtp]i?)?b?$', re.I)
+
+
+def decode_literal(value, name=''):
+    """Converts a value to a Python literal, if possible.
+
+    This is the default decoder. Values that cannot be parsed as a
+    literal are returned as ``pathlib.Path`` objects if the variable
+    name looks like a path, and as strings otherwise.
+
+    """
+    try:
+        # Attempt to parse value as a Python literal
+        if value.lower() in ('true', 'false'):
+            value = value.title()
+        value = ast.literal_eval(value)
+        if isinstance(value, dict):
+            return attrdict.AttrDict(**value)
+    except (SyntaxError, ValueError):
+        name_upper = name.upper()
+        # Return a ``pathlib.Path`` object iff:
+        # * value contains the default OS path separator
+        # * the substring 'PATH', 'DIR', or 'FILE' in the var name
+        if (os.path.sep in value and
+                'PATH' in name_upper or
+                'DIR' in name_upper or
+                'FILE' in name_upper):
+            value = pathlib.Path(value)
+    return value
+
+
+def decode_json(value, name=''):
+    """Decodes a JSON document. Objects are returned as ``AttrDict``."""
+    return json.loads(value, object_hook=attrdict.AttrDict)
+
+
+def decode_csv(value, name=''):
+    """Decodes a comma separated list of strings.
+
+    Items may be quoted to include commas, and surrounding whitespace
+    is ignored.
+
+    """
+    if not value.strip():
+        return []
+    row = next(csv.reader([value], skipinitialspace=True))
+    return [item.strip() for item in row]
+
+
+def decode_duration(value, name=''):
+    """Decodes a duration such as ``30s``, ``1h30m``, or ``250ms``.
+
+    Bare numbers are interpreted as seconds.
+
+    Returns:
+        datetime.timedelta: The decoded duration.
+
+    Raises:
+        ValueError: If the value is not a valid duration.
+
+    """
+    compact = value.strip().lower().replace(' ', '')
+    try:
+        seconds = float(compact)
+    except ValueError:
+        if not _DURATION_FULL_RE.match(compact):
+            raise ValueError('cannot interpret %r as a duration' % value)
+        seconds = sum(float(amount) * _DURATION_UNITS[unit]
+                      for amount, unit in _DURATION_RE.findall(compact))
+    try:
+        # Also rejects infinity and NaN
+        return datetime.timedelta(seconds=seconds)
+    except (OverflowError, ValueError):
+        raise ValueError('duration %r is out of range' % value)
+
+
+def decode_byte_size(value, name=''):
+    """Decodes a byte size such as ``512MiB``, ``10kB`` or ``2G``.
+
+    Decimal (``k``, ``M``, ...) and binary (``Ki``, ``Mi``, ...) unit
+    prefixes are supported, case insensitive.
+
+    Returns:
+        int: The number of bytes.
+
+    Raises:
+        ValueError: If the value is not a valid byte size.
+
+    """
+    match = _BYTE_SIZE_RE.match(value.strip())
+    if match is None:
+        raise ValueError('cannot interpret %r as a byte size' % value)
+    amount, unit = match.groups()
+    return int(float(amount) * _BYTE_SIZE_UNITS[(unit or '').lower()])
+
+
+class Decoder(object):
+    """Converts raw environment variable values to Python objects.
+
+    Args:
+        name (str): The name the decoder is registered under.
+        func (callable): Called with the raw string value and the
+            unprefixed variable name, and returns the decoded value.
+        patterns (iterable): Optional case-insensitive glob patterns,
+            matched against fully prefixed variable names (for example
+            ``'*_TIMEOUT'``), selecting the variables this decoder is
+            used for by default.
+
+    """
+
+    def __init__(self, name, func, patterns=()):  # noqa: D102
+        if isinstance(patterns, str):
+            patterns = (patterns,)
+        self.name = name
+        self.func = func
+        self.patterns = tuple(pattern.upper() for pattern in patterns)
+        self._pattern_re = None
+        if self.patterns:
+            self._pattern_re = re.compile('|'.join(
+                fnmatch.translate(pattern) for pattern in self.patterns))
+
+    def matches(self, key):
+        """Checks whether the decoder applies to a prefixed name."""
+        return (self._pattern_re is not None and
+                self._pattern_re.match(key.upper()) is not None)
+
+    def __call__(self, value, name=''):  # noqa: D102
+        return self.func(value, name)
+
+    def __repr__(self):  # noqa: D105
+        return '<{}({!r})>'.format(self.__class__.__name__, self.name)
+
+
+class _DecoderRegistry(object):
+    """Keeps track of the registered decoders, by name and pattern."""
+
+    def __init__(self):
+        self.decoders = {}
+        # Decoders with patterns, most recently registered first
+        self.patterned = []
+        # Incremented on every change, so bound decoders can be expired
+        self.version = 0
+
+    def register(self, decoder):
+        previous = self.decoders.get(decoder.name)
+        if previous is not None and previous in self.patterned:
+            self.patterned.remove(previous)
+        self.decoders[decoder.name] = decoder
+        if decoder.patterns:
+            self.patterned.insert(0, decoder)
+        self.version += 1
+
+    def lookup(self, decoder):
+        if isinstance(decoder, Decoder):
+            return decoder
+        elif callable(decoder):
+            return Decoder(getattr(decoder, '__name__', 'custom'), decoder)
+        try:
+            return self.decoders[decoder]
+        except KeyError:
+            raise ValueError('unknown decoder %r' % (decoder,))
+
+    def match(self, key):
+        for decoder in self.patterned:
+            if decoder.matches(key):
+                return decoder
+        return self.decoders['literal']
+
+
+_registry = _DecoderRegistry()
+
+
+def register_decoder(name, func, patterns=()):
+    """Registers a decoder, optionally selected by name patterns.
+
+    Registering a decoder under an existing name replaces it. When
+    several decoders match a variable, the most recently registered
+    one wins.
+
+    Args:
+        name (str): The name of the decoder, which can be used to
+            declare the decoder for specific variables with
+            :meth:`Habitat.declare`.
+        func (callable): Called with the raw string value and the
+            unprefixed variable name, and returns the decoded value.
+        patterns: A glob pattern or list of glob patterns, matched
+            against fully prefixed variable names.
+
+    Returns:
+        Decoder: The registered decoder.
+
+    """
+    decoder = Decoder(name, func, patterns)
+    _registry.register(decoder)
+    return decoder
+
+
+register_decoder('literal', decode_literal)
+register_decoder('str', lambda value, name='': value)
+register_decoder('json', decode_json)
+register_decoder('csv', decode_csv)
+register_decoder('duration', decode_duration)
+register_decoder('bytes', decode_byte_size)
+
+
+_GLOB_SPECIAL_RE = re.compile(r'[*?[]')
+
+
+class _TrieNode(object):
+    """A node in the prefix trie of environment variable names."""
+
+    __slots__ = ('children', 'keys')
+
+    def __init__(self):
+        self.children = {}
+        self.keys = set()
+
+    def walk(self):
+        yield self
+        for child in self.children.values():
+            for node in child.walk():
+                yield node
+
+
+class _EnvironmentIndex(object):
+    """Indexes namespaced environment variable names for fast queries.
+
+    Names are split into underscore separated segments and stored in a
+    prefix trie, as well as in a map of final segments, so that glob
+    queries with a literal prefix or suffix only need to consider a
+    small set of candidate names. The index is built in one pass, and
+    :meth:`sync` only applies the changes made to ``os.environ`` since.
+
+    """
+
+    def __init__(self):
+        self.root = _TrieNode()
+        self.suffixes = {}
+        self.environ = {}
+
+    def add(self, key):
+        segments = key.split('_')
+        node = self.root
+        for segment in segments[:-1]:
+            node = node.children.setdefault(segment, _TrieNode())
+        node.keys.add(key)
+        self.suffixes.setdefault(segments[-1], set()).add(key)
+
+    def remove(self, key):
+        segments = key.split('_')
+        path = [self.root]
+        for segment in segments[:-1]:
+            path.append(path[-1].children[segment])
+        path[-1].keys.discard(key)
+        # Prune nodes that no longer lead to any names
+        for segment, parent, node in reversed(list(
+                zip(segments[:-1], path[:-1], path[1:]))):
+            if node.keys or node.children:
+                break
+            del parent.children[segment]
+        keys = self.suffixes[segments[-1]]
+        keys.discard(key)
+        if not keys:
+            del self.suffixes[segments[-1]]
+
+    def sync(self):
+        """Applies changes in ``os.environ`` to the index.
+
+        Returns:
+            set: The names of the variables that were added, changed,
+                or removed since the last sync.
+
+        """
+        changed = set()
+        environ = dict(os.environ)
+        for key in set(self.environ) - set(environ):
+            changed.add(key)
+            self.remove(key)
+            del self.environ[key]
+        for key, value in environ.items():
+            if (not key.partition('_')[0] or '_' not in key or
+                    key != key.upper()):
+                # Not accessible through a namespace
+                continue
+            previous = self.environ.get(key)
+            if previous == value:
+                continue
+            changed.add(key)
+            if previous is None:
+                self.add(key)
+            self.environ[key] = value
+        return changed
+
+    def candidates(self, pattern):
+        """Finds the names possibly matching a glob pattern."""
+        literal = _GLOB_SPECIAL_RE.split(pattern)
+        prefix, suffix = literal[0], literal[-1]
+        if len(literal) == 1:
+            # No wildcards
+            return {pattern} if pattern in self.environ else set()
+        keys = None
+        if prefix:
+            segments = prefix.split('_')
+            node = self.root
+            for segment in segments[:-1]:
+                node = node.children.get(segment)
+                if node is None:
+                    return set()
+            keys = set()
+            partial = segments[-1]
+            if not partial:
+                nodes = [node]
+            else:
+                nodes = [child for segment, child in node.children.items()
+                         if segment.startswith(partial)]
+                keys.update(key for key in node.keys
+                            if key.rpartition('_')[2].startswith(partial))
+            for start in nodes:
+                for descendant in start.walk():
+                    keys.update(descendant.keys)
+        if '[' in suffix or ']' in suffix:
+            # Bracket expressions aren't literal, so don't narrow by the
+            # text following them
+            suffix = ''
+        if '_' in suffix:
+            matches = self.suffixes.get(suffix.rpartition('_')[2], set())
+            keys = matches if keys is None else keys & matches
+        return set(self.environ) if keys is None else keys
+
+    def select(self, pattern):
+        """Finds the names matching a glob pattern or regular expression.
+
+        Args:
+            pattern: A case-insensitive glob pattern, or a compiled
+                regular expression.
+
+        Returns:
+            list: The matching names, sorted.
+
+        """
+        if hasattr(pattern, 'match'):
+            keys = (key for key in self.environ if pattern.match(key))
+        else:
+            pattern = pattern.upper()
+            regex = re.compile(fnmatch.translate(pattern))
+            keys = (key for key in self.candidates(pattern)
+                    if regex.match(key))
+        return sorted(keys)
+
+
+_index = _EnvironmentIndex()
+
+
+_CACHE_MAGIC = b'BIOME\x01'
+_CACHE_HEADER_SIZE = len(_CACHE_MAGIC) + hashlib.sha256().digest_size
+
+
+def _get_version():
+    try:
+        from importlib import metadata
+        return metadata.version(package_name)
+    except ImportError:
+        # Python < 3.8, or not installed
+        return None
+
+
+def _file_stat(path):
+    try:
+        stat = os.stat(str(path))
+    except OSError:
+        return (str(path), None, None)
+    mtime = getattr(stat, 'st_mtime_ns', stat.st_mtime)
+    return (str(path), stat.st_size, mtime)
+
+
+def _code_digest(code):
+    """Hashes a code object, including constants and nested code."""
+    digest = hashlib.sha256(code.co_code)
+    digest.update(repr(code.co_names).encode('utf-8'))
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            digest.update(_code_digest(const).encode('ascii'))
+        else:
+            digest.update(repr(const).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _callable_digest(func):
+    """Hashes a callable's implementation across processes.
+
+    Covers the code, default arguments, and closure contents of
+    functions, and the arguments of ``functools.partial`` objects.
+
+    Returns:
+        str: The digest, or ``None`` if the callable's behavior can't be
+            identified, such as for bound methods or callable objects.
+
+    """
+    name = '%s.%s' % (
+        getattr(func, '__module__', None),
+        getattr(func, '__qualname__', getattr(func, '__name__', None)),
+    )
+    digest = hashlib.sha256(name.encode('utf-8'))
+    if isinstance(func, functools.partial):
+        inner = _callable_digest(func.func)
+        if inner is None:
+            return None
+        for part in (inner, func.args, sorted((func.keywords or {}).items())):
+            digest.update(repr(part).encode('utf-8'))
+        return digest.hexdigest()
+    if isinstance(func, (types.BuiltinFunctionType, type)):
+        return digest.hexdigest()
+    if not isinstance(func, types.FunctionType):
+        return None
+    digest.update(_code_digest(func.__code__).encode('ascii'))
+    for part in (func.__defaults__, getattr(func, '__kwdefaults__', None)):
+        digest.update(repr(part).encode('utf-8'))
+    for cell in func.__closure__ or ():
+        contents = cell.cell_contents
+        if callable(contents):
+            contents = _callable_digest(contents)
+            if contents is None:
+                return None
+        digest.update(repr(contents).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _decoder_identity(decoder):
+    """Identifies a decoder's implementation across processes."""
+    return (decoder.name, decoder.patterns, _callable_digest(decoder.func))
+
+
+def _cache_fingerprint(habitats, files):
+    """Hashes everything the decoded values of namespaces depend on.
+
+    This includes the biome version, the variables in the namespaces,
+    the registered and declared decoders, and the size and
+    modification time of the given files.
+
+    """
+    digest = hashlib.sha256()
+    prefixes = sorted(habitat._prefix for habitat in habitats)
+    starts = tuple('%s_' % prefix for prefix in prefixes)
+    environ = sorted((key, value) for key, value in os.environ.items()
+                     if key.startswith(starts))
+    decoders = sorted(_decoder_identity(decoder)
+                      for decoder in _registry.decoders.values())
+    declared = sorted(
+        (habitat._prefix, habitat._interpolation,
+         sorted((name, _decoder_identity(decoder))
+                for name, decoder in habitat._declared.items()))
+        for habitat in habitats)
+    stats = [_file_stat(path) for path in files]
+    version = (_get_version(), _file_stat(__file__))
+    for part in (version, prefixes, environ, decoders, declared, stats):
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.digest()
+
+
+def _read_cache(path, fingerprint):
+    """Loads decoded namespaces from a cache file.
+
+    Returns:
+        dict: Raw and decoded values keyed by prefix, or ``None`` if
+            the cache does not exist or its fingerprint doesn't match.
+
+    """
+    try:
+        with open(str(path), 'rb') as fp:
+            size = os.fstat(fp.fileno()).st_size
+            if size <= _CACHE_HEADER_SIZE:
+                return None
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                # Only the header is paged in when the cache is stale
+                if (buf[:len(_CACHE_MAGIC)] != _CACHE_MAGIC or
+                        buf[len(_CACHE_MAGIC):_CACHE_HEADER_SIZE] !=
+                        fingerprint):
+                    return None
+                return pickle.loads(buf[_CACHE_HEADER_SIZE:])
+            finally:
+                buf.close()
+    except (IOError, OSError, ValueError, EOFError, pickle.PickleError):
+        return None
+
+
+def _write_cache(path, fingerprint, namespaces):
+    """Atomically writes decoded namespaces to a cache file.
+
+    Returns:
+        bool: ``True`` if the cache was written, or ``False`` if the
+            decoded values could not be serialized, or the file could
+            not be written.
+
+    """
+    try:
+        payload = pickle.dumps(namespaces, pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return False
+    path = str(path)
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix='.%s.' % os.path.basename(path),
+        )
+    except (IOError, OSError):
+        return False
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(_CACHE_MAGIC)
+            fp.write(fingerprint)
+            fp.write(payload)
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+    except (IOError, OSError):
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return True
+
+
+def _decode_for_cache(habitat):
+    """Decodes the cacheable variables of a namespace.
+
+    Values are decoded from the namespace's storage rather than through
+    item access, so context local overrides never end up in the cache.
+
+    Returns:
+        tuple: The raw and decoded values of the variables.
+
+    """
+    environ, decoded = {}, {}
+    if habitat._interpolation:
+        # Interpolated values depend on other namespaces
+        return environ, decoded
+    for name, value in dict.items(habitat):
+        if name in habitat._overridden:
+            continue
+        decoder = habitat._get_decoder(name)
+        if _callable_digest(decoder.func) is None:
+            # Changes to the decoder can't be detected
+            continue
+        try:
+            decoded[name] = decoder(value, name)
+        except Exception:  # noqa: B902
+            # Leave decoding errors to be raised on access
+            continue
+        environ[name] = value
+    return environ, decoded
+
+
+class _Overlay(object):
+    """Raw and decoded values overriding a namespace in a context."""
+
+    __slots__ = ('values', 'cache')
+
+    def __init__(self, values):
+        self.values = values
+        self.cache = {}
+
+    def decode(self, habitat, name):
+        try:
+            return self.cache[name]
+        except KeyError:
+            pass
+        value = self.values[name]
+        if value is _MISSING:
+            raise EnvironmentError.not_found(habitat._prefix, name)
+        value = habitat._get_decoder(name)(value, name)
+        self.cache[name] = value
+        return value
+
+
+if contextvars is not None:
+    # Maps prefixes to the overlays active in the current context
+    _overlays = contextvars.ContextVar('biome_overlays', default=None)
+else:  # pragma: no cover
+    _overlays = None
+
+
+def _override_value(value):
+    if value is None:
+        return _MISSING
+    return value if isinstance(value, str) else str(value)
+
+
 class Habitat(attrdict.AttrDict):  # noqa: D205,D400
     """Provides attribute/map style access to a set of namespaced
     environment variables.
@@ -45,19 +708,52 @@ class Habitat(attrdict.AttrDict):  # noqa: D205,D400
     literals when possible, and can also be explicitly accessed through
     the ``get``, ``get_bool``, ``get_int``, and ``get_path`` methods.
 
+    Other formats (such as JSON, comma separated lists, durations, or
+    byte sizes) can be decoded by declaring a decoder for a variable,
+    or by registering a decoder for a name pattern with
+    :func:`register_decoder`. Decoded values are cached until the
+    variable changes, so repeated accesses return the same object, and
+    mutable values (such as lists and dictionaries) must be copied
+    before being modified.
+
+    References to other variables, such as ``${YOURAPP_HOST}``, are
+    expanded before decoding if interpolation is enabled. See
+    :meth:`enable_interpolation`.
+
     Args:
         prefix (str): The prefix to use, sans trailing underscore.
+        decoders (dict): Optional mapping of unprefixed variable names
+            to decoder names or callables. See :meth:`declare`.
+        interpolate (bool): Whether to expand variable references.
 
     """
 
-    def __new__(cls, prefix):  # noqa: D102
+    def __new__(cls, prefix, decoders=None,  # noqa: D102
+                interpolate=False):
         if isinstance(prefix, attrdict.AttrDict):
             return prefix
         return super(Habitat, cls).__new__(cls, prefix)
 
-    def __init__(self, prefix):  # noqa: D102
+    def __init__(self, prefix, decoders=None,  # noqa: D102
+                 interpolate=False):
         self._setattr('_prefix', _sanitize_prefix(prefix))
+        self._setattr('_declared', {})
+        self._setattr('_bound', {})
+        self._setattr('_cache', {})
+        self._setattr('_registry_version', _registry.version)
+        self._setattr('_interpolation', interpolate)
+        # Number of active ``override`` blocks for each variable
+        self._setattr('_overridden', {})
+        # Expanded values and reverse dependencies, by prefixed name
+        self._setattr('_expanded', {})
+        self._setattr('_dependents', {})
+        # Values of referenced variables outside of the namespace
+        self._setattr('_external', {})
+        # Interpolating Habitats referencing variables in the namespace
+        self._setattr('_referrers', {})
         super(Habitat, self).__init__(self.get_environ(self._prefix))
+        for name, decoder in (decoders or {}).items():
+            self.declare(name, decoder)
 
     @classmethod
     def get_environ(cls, prefix):
@@ -233,46 +929,601 @@ class Habitat(attrdict.AttrDict):  # noqa: D205,D400
         """Update all environment variables from ``os.environ``.
 
         Use if ``os.environ`` was modified dynamically *after* you
-        accessed an environment namespace with ``biome``.
+        accessed an environment namespace with ``biome``. Variables
+        with an active :meth:`override` are left as they are.
+
+        """
+        changed = []
+        for name, value in self.get_environ(self._prefix):
+            if name in self._overridden:
+                continue
+            if super(Habitat, self).get(name) != value:
+                super(Habitat, self).__setitem__(name, value)
+                changed.append('%s_%s' % (self._prefix, name))
+        self._invalidate(changed)
+        self._check_external()
+
+    def enable_interpolation(self, enabled=True):
+        """Enables or disables expansion of variable references.
+
+        When enabled, ``${NAME}`` in a value is replaced by the value
+        of the environment variable ``NAME`` (including its prefix)
+        before decoding, and ``$$`` is replaced by ``$``. References
+        are expanded recursively. Variables in this namespace are
+        resolved from the namespace. Variables in other namespaces are
+        resolved from their Habitat if it was accessed through biome,
+        so that its overrides apply, and from ``os.environ`` otherwise.
+
+        Expanded values are memoized along with the references between
+        them, so that :meth:`refresh` only expands the values that
+        depend on changed variables again.
+
+        Args:
+            enabled (bool): Whether to expand variable references.
+
+        """
+        self._setattr('_interpolation', enabled)
+        self._expanded.clear()
+        self._dependents.clear()
+        self._external.clear()
+        self._cache.clear()
+
+    def _expand(self, key, memo, stack=()):
+        """Expands the references in a variable's value.
+
+        Dependencies are only recorded when expanding into the shared
+        memo of expanded values.
+
+        """
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+        if key in stack:
+            raise InterpolationError.cycle(stack + (key,))
+        track = memo is self._expanded
+        value = self._lookup_raw(key, track)
+        if value is None:
+            raise InterpolationError.missing(key, stack[-1])
+        stack += (key,)
+
+        def substitute(match):
+            ref = match.group(1)
+            if ref is None:
+                return '$'
+            if track:
+                self._dependents.setdefault(ref, set()).add(key)
+            return self._expand(ref, memo, stack)
+
+        value = memo[key] = _INTERPOLATION_RE.sub(substitute, value)
+        return value
+
+    def _lookup_raw(self, key, track):
+        prefix = '%s_' % self._prefix
+        if key.startswith(prefix):
+            return self._get_raw(key[len(prefix):])
+        value = self._resolve_external(key, track)
+        if track:
+            self._external[key] = value
+        return value
+
+    def _get_raw(self, name):
+        """Returns a variable's raw value, including overrides."""
+        overlay = self._get_overlay()
+        if overlay is not None and name in overlay.values:
+            value = overlay.values[name]
+            return None if value is _MISSING else value
+        return super(Habitat, self).get(name)
+
+    def _resolve_external(self, key, track=False):
+        """Returns the raw value of a variable in another namespace.
+
+        The variable is read from the namespace's Habitat if it was
+        accessed through biome, so that its overrides apply, or from
+        ``os.environ`` otherwise. If ``track`` is set, the other
+        Habitat invalidates this one's values using the variable when
+        it changes.
+
+        """
+        habitat = _biome._find_namespace(key)
+        if habitat is None or habitat is self:
+            return os.environ.get(key)
+        name = key[len(habitat._prefix) + 1:]
+        if track:
+            habitat._referrers.setdefault(name, {})[id(self)] = self
+        return habitat._get_raw(name)
+
+    def _check_external(self):
+        """Invalidates values using changed variables of other namespaces.
+
+        Only needed for variables read from ``os.environ``, or from
+        namespaces accessed since, as Habitats notify the namespaces
+        referencing them of changes.
+
+        """
+        self._invalidate([key for key, value in self._external.items()
+                          if self._resolve_external(key) != value])
+
+    def _decode_in_context(self, name):
+        # Values expanded with context local overrides (of any
+        # namespace) are only valid in that context, so aren't cached
+        value = self._get_raw(name)
+        if value is None:
+            raise EnvironmentError.not_found(self._prefix, name)
+        value = self._expand('%s_%s' % (self._prefix, name), {})
+        return self._get_decoder(name)(value, name)
+
+    def _invalidate(self, keys):
+        """Drops cached values of variables and everything using them."""
+        prefix = '%s_' % self._prefix
+        pending = list(keys)
+        while pending:
+            key = pending.pop()
+            self._expanded.pop(key, None)
+            self._external.pop(key, None)
+            if key.startswith(prefix):
+                name = key[len(prefix):]
+                self._cache.pop(name, None)
+                for referrer in self._referrers.pop(name, {}).values():
+                    referrer._invalidate([key])
+            pending.extend(self._dependents.pop(key, ()))
+
+    def to_environ(self):
+        """Returns the namespace as environment variables.
+
+        Values are the raw strings from the environment (including any
+        active overrides), so they can be passed to child processes
+        as is, e.g. ``subprocess.Popen(env=dict(os.environ,
+        **habitat.to_environ()))``.
+
+        Returns:
+            dict: Prefixed variable names and their raw values.
 
         """
-        super(Habitat, self).update(self.get_environ(self._prefix))
+        prefix = '%s_' % self._prefix
+        environ = {prefix + name: value
+                   for name, value in dict.items(self)}
+        overlay = self._get_overlay()
+        if overlay is not None:
+            for name, value in overlay.values.items():
+                if value is _MISSING:
+                    environ.pop(prefix + name, None)
+                else:
+                    environ[prefix + name] = value
+        return environ
+
+    def warm(self):
+        """Decodes and caches all variables in the namespace.
+
+        Errors raised by decoders (including ``OSError`` from decoders
+        reading slow sources) are collected instead of raised, and will
+        be raised again when the variable is accessed.
+
+        Returns:
+            AttrDict: A report with the ``elapsed`` time in seconds,
+                the number of ``variables`` decoded, and any
+                decoding ``errors`` keyed by variable name.
+
+        """
+        start = _timer()
+        errors = {}
+        for name in list(self.keys()):
+            try:
+                self[name]
+            except Exception as exc:  # noqa: B902
+                errors[name] = exc
+        return attrdict.AttrDict(
+            elapsed=_timer() - start,
+            variables=len(self) - len(errors),
+            errors=errors,
+        )
+
+    @contextlib.contextmanager
+    def override(self, **values):
+        """Temporarily overrides variables in the namespace.
+
+        Overrides are visible everywhere the namespace is used, but do
+        not modify ``os.environ``. Values that aren't strings are
+        converted with ``str``, and ``None`` unsets a variable. Only
+        the overridden variables are touched, and their previous
+        values are restored on exit. :meth:`refresh` does not change
+        overridden variables.
+
+        Args:
+            **values: Case-insensitive, unprefixed variable names and
+                their values.
+
+        """
+        values = {name.upper(): _override_value(value)
+                  for name, value in values.items()}
+        previous = {name: super(Habitat, self).get(name, _MISSING)
+                    for name in values}
+        for name, value in values.items():
+            if value is not _MISSING:
+                self[name] = value
+            elif previous[name] is not _MISSING:
+                del self[name]
+            self._overridden[name] = self._overridden.get(name, 0) + 1
+        try:
+            yield self
+        finally:
+            for name, value in previous.items():
+                self._overridden[name] -= 1
+                if not self._overridden[name]:
+                    del self._overridden[name]
+                current = super(Habitat, self).get(name, _MISSING)
+                if current != values[name]:
+                    # Assigned again since
+                    continue
+                if value is not _MISSING:
+                    self[name] = value
+                elif current is not _MISSING:
+                    del self[name]
+
+    @contextlib.contextmanager
+    def override_context(self, **values):
+        """Overrides variables in the current context only.
+
+        Like :meth:`override`, but the overrides are only visible to
+        the current thread or asynchronous task (and tasks it starts),
+        using :mod:`contextvars`. Other threads keep seeing the
+        original values. Overrides apply to item and attribute access,
+        the getters, and ``in``, but not to iteration over the
+        namespace.
+
+        Args:
+            **values: Case-insensitive, unprefixed variable names and
+                their values.
+
+        Raises:
+            RuntimeError: If :mod:`contextvars` is not available.
+
+        """
+        if _overlays is None:
+            raise RuntimeError('contextvars is required for context '
+                               'local overrides')
+        overlays = dict(_overlays.get() or {})
+        overlay = overlays.get(self._prefix)
+        merged = dict(overlay.values) if overlay is not None else {}
+        merged.update((name.upper(), _override_value(value))
+                      for name, value in values.items())
+        overlays[self._prefix] = _Overlay(merged)
+        token = _overlays.set(overlays)
+        try:
+            yield self
+        finally:
+            _overlays.reset(token)
+
+    def _get_overlay(self):
+        if _overlays is None:
+            return None
+        overlays = _overlays.get()
+        if not overlays:
+            return None
+        return overlays.get(self._prefix)
+
+    def declare(self, name, decoder):
+        """Declares the decoder to use for a variable.
+
+        Declared decoders take precedence over decoders selected by
+        name pattern.
+
+        Args:
+            name (str): The case-insensitive, unprefixed variable name.
+            decoder: The name of a registered decoder (such as
+                ``'json'``, ``'csv'``, ``'duration'`` or ``'bytes'``),
+                a :class:`Decoder`, or a callable accepting the raw
+                value and the variable name.
+
+        Raises:
+            ValueError: If no decoder is registered under the given
+                name.
+
+        """
+        name = name.upper()
+        self._declared[name] = _registry.lookup(decoder)
+        self._bound.pop(name, None)
+        self._cache.pop(name, None)
+
+    def _expire_decoders(self):
+        if self._registry_version != _registry.version:
+            # Decoders were registered since bindings were made
+            self._bound.clear()
+            self._cache.clear()
+            self._setattr('_registry_version', _registry.version)
+
+    def _get_decoder(self, name):
+        self._expire_decoders()
+        try:
+            return self._bound[name]
+        except KeyError:
+            pass
+        if name in self._declared:
+            decoder = self._declared[name]
+        else:
+            decoder = _registry.match('%s_%s' % (self._prefix, name))
+        self._bound[name] = decoder
+        return decoder
 
     def __contains__(self, name):  # noqa: D105
-        return super(Habitat, self).__contains__(name.upper())
+        name = name.upper()
+        overlay = self._get_overlay()
+        if overlay is not None and name in overlay.values:
+            return overlay.values[name] is not _MISSING
+        return super(Habitat, self).__contains__(name)
 
     def __getitem__(self, name):  # noqa: D105
         name = name.upper()
+        overlays = _overlays.get() if _overlays is not None else None
+        if overlays and self._interpolation:
+            return self._decode_in_context(name)
+        overlay = overlays.get(self._prefix) if overlays else None
+        if overlay is not None and name in overlay.values:
+            return overlay.decode(self, name)
+        self._expire_decoders()
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
         try:
             value = super(Habitat, self).__getitem__(name)
         except KeyError:
             raise EnvironmentError.not_found(self._prefix, name)
-        try:
-            # Attempt to parse value as a Python literal
-            if value.lower() in ('true', 'false'):
-                value = value.title()
-            value = ast.literal_eval(value)
-            if isinstance(value, dict):
-                return attrdict.AttrDict(**value)
-        except (SyntaxError, ValueError):
-            name_upper = name.upper()
-            # Return a ``pathlib.Path`` object iff:
-            # * value contains the default OS path separator
-            # * the substring 'PATH', 'DIR', or 'FILE' in the var name
-            if (os.path.sep in value and
-                    'PATH' in name_upper or
-                    'DIR' in name_upper or
-                    'FILE' in name_upper):
-                value = pathlib.Path(value)
+        if self._interpolation:
+            value = self._expand('%s_%s' % (self._prefix, name),
+                                 self._expanded)
+        value = self._get_decoder(name)(value, name)
+        self._cache[name] = value
         return value
 
+    def __setitem__(self, name, value):  # noqa: D105
+        super(Habitat, self).__setitem__(name, value)
+        self._invalidate(['%s_%s' % (self._prefix, name)])
+
+    def __delitem__(self, name):  # noqa: D105
+        super(Habitat, self).__delitem__(name)
+        self._invalidate(['%s_%s' % (self._prefix, name)])
+
     def __repr__(self):  # noqa: D105
         return '<{}({!r})>'.format(self.__class__.__name__, self._prefix)
 
 
+def _format_shell(environ):
+    return ''.join('export %s=%s\n' % (key, _shell_quote(value))
+                   for key, value in sorted(environ.items()))
+
+
+def _format_dotenv(environ):
+    def quote(value):
+        for char, escaped in (('\\', '\\\\'), ('"', '\\"'),
+                              ('\n', '\\n')):
+            value = value.replace(char, escaped)
+        return '"%s"' % value
+    return ''.join('%s=%s\n' % (key, quote(value))
+                   for key, value in sorted(environ.items()))
+
+
+def _format_json(environ):
+    return json.dumps(environ, indent=2, sort_keys=True) + '\n'
+
+
+_EXPORT_FORMATS = {
+    'environ': dict,
+    'dotenv': _format_dotenv,
+    'json': _format_json,
+    'shell': _format_shell,
+}
+
+
 class Biome(attrdict.AttrDict):
     """Provides utilities for accessing environment variables."""
 
+    def register_decoder(self, name, func, patterns=()):
+        """Registers a decoder. See :func:`register_decoder`."""
+        return register_decoder(name, func, patterns)
+
+    def refresh(self):
+        """Update all namespaces from ``os.environ``.
+
+        Refreshes every namespace accessed so far, as well as the index
+        used by :meth:`select`.
+
+        """
+        _index.sync()
+        for habitat in self.values():
+            habitat.refresh()
+
+    def export(self, prefixes, format='environ'):
+        """Exports namespaces for use by other processes.
+
+        Args:
+            prefixes (iterable): The namespace prefixes to export.
+            format (str): One of ``'environ'``, for a mapping suitable
+                for the ``env`` argument of :class:`subprocess.Popen`,
+                ``'shell'``, for shell ``export`` statements,
+                ``'dotenv'``, or ``'json'``.
+
+        Returns:
+            The raw values of the variables in the namespaces, as a
+            ``dict`` for the ``'environ'`` format, or as ``str``
+            otherwise.
+
+        Raises:
+            ValueError: If the format is not supported.
+
+        """
+        try:
+            formatter = _EXPORT_FORMATS[format]
+        except KeyError:
+            raise ValueError('unsupported export format %r' % (format,))
+        if isinstance(prefixes, str):
+            prefixes = (prefixes,)
+        environ = {}
+        for prefix in prefixes:
+            environ.update(self.__getattr__(prefix).to_environ())
+        return formatter(environ)
+
+    def load_cache(self, path, prefixes, files=()):
+        """Loads namespaces from a persistent cache of decoded values.
+
+        The namespaces are refreshed, and their decoded values are
+        loaded from the cache at ``path``. If the cache is missing or
+        stale, all of their values are decoded instead, and the cache
+        is rewritten if possible. The cache is stale if any variable in
+        the namespaces, any registered or declared decoder, any of
+        ``files``, or the version of biome changed since it was
+        written. Values of overridden variables, and of namespaces
+        with interpolation enabled, are not cached.
+
+        Cache files are unpickled, and must only be writable by trusted
+        users.
+
+        Args:
+            path (str): The path of the cache file.
+            prefixes (iterable): The namespace prefixes to cache.
+            files (iterable): Paths of additional files the decoded
+                values depend on, such as secrets or env files.
+
+        Returns:
+            bool: ``True`` if the namespaces were loaded from the cache.
+
+        """
+        habitats = [self.__getattr__(_sanitize_prefix(prefix))
+                    for prefix in prefixes]
+        for habitat in habitats:
+            habitat.refresh()
+            habitat._expire_decoders()
+        fingerprint = _cache_fingerprint(habitats, files)
+        namespaces = _read_cache(path, fingerprint)
+        if namespaces is not None:
+            for habitat in habitats:
+                environ, decoded = namespaces[habitat._prefix]
+                for name, value in decoded.items():
+                    if (name not in habitat._overridden and
+                            dict.get(habitat, name) == environ[name]):
+                        habitat._cache[name] = value
+            return True
+        namespaces = {habitat._prefix: _decode_for_cache(habitat)
+                      for habitat in habitats}
+        _write_cache(path, fingerprint, namespaces)
+        return False
+
+    def prefetch(self, prefixes, max_workers=None, timeout=None):
+        """Loads and decodes namespaces concurrently.
+
+        Namespaces are read and warmed (see :meth:`Habitat.warm`) on a
+        thread pool, so that slow decoders don't add up on first
+        access. Namespaces that were already accessed are warmed in
+        place, keeping their declared decoders and overrides, and new
+        namespaces are stored once they finish before the deadline.
+
+        Args:
+            prefixes (iterable): The namespace prefixes to load.
+            max_workers (int): The maximum number of threads to use.
+                Defaults to one per namespace, up to 8.
+            timeout (float): The number of seconds to wait for
+                namespaces to load. Namespaces that are still loading
+                after the deadline are left to finish in the
+                background, but new namespaces are not stored.
+
+        Returns:
+            AttrDict: A report for each prefix, containing whether it
+                is ``done``, and if so, the ``elapsed`` time in seconds
+                (including reading the environment), the number of
+                ``variables`` decoded, any decoding ``errors``, and the
+                ``error`` raised while loading the namespace, if any.
+
+        """
+        prefixes = sorted({_sanitize_prefix(prefix) for prefix in prefixes})
+        if not prefixes:
+            return attrdict.AttrDict()
+
+        def load(prefix):
+            start = _timer()
+            habitat = self.get(prefix)
+            if habitat is None:
+                habitat = _module_ref.Habitat(prefix)
+            report = habitat.warm()
+            report.elapsed = _timer() - start
+            return habitat, report
+
+        executor = futures.ThreadPoolExecutor(
+            max_workers or min(len(prefixes), 8))
+        try:
+            pending = {executor.submit(load, prefix): prefix
+                       for prefix in prefixes}
+            done, not_done = futures.wait(pending, timeout=timeout)
+        finally:
+            executor.shutdown(wait=False)
+        reports = attrdict.AttrDict()
+        for future in not_done:
+            future.cancel()
+            reports[pending[future]] = attrdict.AttrDict(done=False)
+        for future in done:
+            prefix = pending[future]
+            try:
+                habitat, report = future.result()
+            except Exception as exc:  # noqa: B902
+                reports[prefix] = attrdict.AttrDict(done=True, error=exc)
+                continue
+            report.update(done=True, error=None)
+            self.setdefault(prefix, habitat)
+            reports[prefix] = report
+        return reports
+
+    def select(self, pattern, errors=None):
+        """Queries variables across all namespaces.
+
+        The first query builds an index of the environment, which is
+        only updated by :meth:`refresh`.
+
+        Variables are decoded by the namespace with the longest
+        matching prefix that was already accessed, so its declared
+        decoders and overrides apply. Other variables are grouped by
+        the first segment of their name, and decoded from the index
+        without creating namespaces.
+
+        Args:
+            pattern: A case-insensitive glob pattern (such as
+                ``'*_HOST'`` or ``'SERVICE_*_URL'``), or a compiled
+                regular expression, matched against fully prefixed
+                variable names.
+            errors (dict): If provided, exceptions raised while decoding
+                variables are stored in it, keyed by prefixed name.
+                Variables that fail to decode are left out of the
+                results either way.
+
+        Returns:
+            AttrDict: The decoded values of the matching variables,
+                keyed by namespace and unprefixed variable name.
+
+        """
+        if not _index.environ:
+            _index.sync()
+        selected = attrdict.AttrDict()
+        for key in _index.select(pattern):
+            habitat = self._find_namespace(key)
+            if habitat is None:
+                prefix, _, name = key.partition('_')
+            else:
+                prefix, name = habitat._prefix, key[len(habitat._prefix) + 1:]
+            try:
+                if habitat is None:
+                    value = _registry.match(key)(_index.environ[key], name)
+                else:
+                    if not dict.__contains__(habitat, name):
+                        habitat.refresh()
+                    if name not in habitat:
+                        # Unset by an override
+                        continue
+                    value = habitat[name]
+            except Exception as exc:  # noqa: B902
+                if errors is not None:
+                    errors[key] = exc
+                continue
+            selected.setdefault(prefix, {})[name] = value
+        return selected
+
     def __getattr__(self, name):
         if name in ('_lib', '__package__'):
             return _module_ref
@@ -293,9 +1544,23 @@ class Biome(attrdict.AttrDict):
             self.__class__.__name__,
             dict.__repr__(self))
 
+    def _find_namespace(self, key):
+        """Finds the accessed namespace a prefixed name belongs to.
+
+        The namespace with the longest matching prefix is returned, or
+        ``None`` if no namespace matches.
+
+        """
+        segments = key.split('_')
+        for end in range(len(segments) - 1, 0, -1):
+            habitat = dict.get(self, '_'.join(segments[:end]))
+            if habitat is not None:
+                return habitat
+        return None
+
 
-sys.modules[package_name] = Biome()
-for prop in ('file', 'name'):
+_biome = sys.modules[package_name] = Biome()
+for prop in ('file', 'name', 'path'):
     object.__setattr__(sys.modules[package_name], '__%s__' % prop,
                        locals()['__%s__' % prop])
 sys.modules['%s._lib' % package_name] = _module_ref
@@ -0,0 +1,49 @@
+"""Command line interface for exporting environment namespaces."""
+from __future__ import absolute_import
+
+import argparse
+import sys
+
+import biome
+
+
+__all__ = ('main',)
+
+
+def main(argv=None):
+    """Command line entrypoint.
+
+    Args:
+        argv (list): The command line arguments, excluding the program
+            name. Defaults to ``sys.argv[1:]``.
+
+    Returns:
+        int: The exit status.
+
+    """
+    parser = argparse.ArgumentParser(prog='python -m biome')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    export_parser = subparsers.add_parser(
+        'export',
+        help='print the variables in one or more namespaces',
+    )
+    export_parser.add_argument(
+        'prefixes',
+        metavar='PREFIX',
+        nargs='+',
+        help='namespace prefix to export',
+    )
+    export_parser.add_argument(
+        '-f', '--format',
+        choices=('shell', 'dotenv', 'json'),
+        default='shell',
+        help='output format (default: shell)',
+    )
+    args = parser.parse_args(argv)
+    sys.stdout.write(biome.export(args.prefixes, format=args.format))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,13 @@
 """Biome unit tests."""
+import datetime
+import functools
+import json
 import os
 import pathlib
+import re
+import subprocess
+import sys
+import threading
 
 import biome
 
@@ -23,6 +30,17 @@ def str2bool(string):
     return lower == "true"
 
 
+@pytest.fixture
+def decoder_registry():
+    """Restore the registered decoders after a test."""
+    registry = biome._lib._registry
+    decoders, patterned = dict(registry.decoders), list(registry.patterned)
+    yield registry
+    registry.decoders, registry.patterned = decoders, patterned
+    # Expire decoders bound during the test, without reusing a version
+    registry.version += 1
+
+
 def setup_module(module):
     """Setup test environment."""
     os.environ["YOURAPP_HOST"] = "dev.yourapp"
@@ -121,3 +139,472 @@ def test_refresh():
     assert "debug" not in biome.YOURAPP
     biome.YOURAPP.refresh()
     assert "debug" in biome.YOURAPP
+
+
+def test_decoders_declared():
+    os.environ["DECODE_SETTINGS"] = '{"host": "127.0.0.1", "ports": [1, 2]}'
+    os.environ["DECODE_HOSTS"] = 'a, b, "c,d"'
+    os.environ["DECODE_TIMEOUT"] = "1m30s"
+    os.environ["DECODE_CACHE_SIZE"] = "512MiB"
+    habitat = biome._lib.Habitat("decode", decoders={"settings": "json"})
+    habitat.declare("hosts", "csv")
+    habitat.declare("timeout", "duration")
+    habitat.declare("cache_size", "bytes")
+    assert habitat.settings.host == "127.0.0.1"
+    assert habitat["settings"]["ports"] == [1, 2]
+    assert habitat.get_list("hosts") == ["a", "b", "c,d"]
+    assert habitat.timeout == datetime.timedelta(seconds=90)
+    assert habitat.cache_size == 512 * 1024 ** 2
+    habitat.declare("cache_size", lambda value, name: value.lower())
+    assert habitat.cache_size == "512mib"
+    with pytest.raises(ValueError):
+        habitat.declare("timeout", "nonexistent")
+    with pytest.raises(ValueError):
+        biome._lib.Habitat("decode", decoders={"timeout": "typo"})
+    for value in ("inf", "nan", "1e400", "99999999999d"):
+        with pytest.raises(ValueError):
+            biome._lib.decode_duration(value)
+
+
+def test_decoders_pattern(decoder_registry):
+    os.environ["PATTERN_READ_TIMEOUT"] = "250ms"
+    os.environ["PATTERN_TIMEOUT_COUNT"] = "3"
+    habitat = biome._lib.Habitat("pattern")
+    assert habitat.read_timeout == "250ms"
+    biome.register_decoder("timeout", biome._lib.decode_duration,
+                           "pattern_*_timeout")
+    assert habitat.read_timeout == datetime.timedelta(milliseconds=250)
+    assert habitat.timeout_count == 3
+
+
+def test_decoders_cache():
+    os.environ["CACHED_VALUE"] = "[1, 2]"
+    habitat = biome._lib.Habitat("cached")
+    assert habitat["value"] is habitat["value"]
+    os.environ["CACHED_VALUE"] = "[3]"
+    habitat.refresh()
+    assert habitat.value == (3,)
+
+
+def test_select():
+    os.environ["SELECT_DB_HOST"] = "db.local"
+    os.environ["SELECT_SERVICE_A_URL"] = "http://a"
+    os.environ["SELECTED_CACHE_HOST"] = "cache.local"
+    os.environ["SELECTED_CACHE_PORT"] = "6379"
+    selected = biome.select("select*_host")
+    assert selected == {
+        "SELECT": {"DB_HOST": "db.local"},
+        "SELECTED": {"CACHE_HOST": "cache.local"},
+    }
+    assert biome.select("SELECT_SERVICE_*_URL").SELECT.SERVICE_A_URL == \
+        "http://a"
+    assert biome.select(re.compile(r"SELECTED_.*_PORT$")) == {
+        "SELECTED": {"CACHE_PORT": 6379},
+    }
+    assert not biome.select("SELECT_NOTHING_*")
+    assert biome.select("SELECT*[_]HOST") == {
+        "SELECT": {"DB_HOST": "db.local"},
+        "SELECTED": {"CACHE_HOST": "cache.local"},
+    }
+    assert biome.select("SELECTED_CACHE_[HP]O[RS]T") == {
+        "SELECTED": {"CACHE_HOST": "cache.local", "CACHE_PORT": 6379},
+    }
+
+
+def test_select_override():
+    os.environ["SELECTOV_HOST"] = "dev.yourapp"
+    os.environ["SELECTOV_PORT"] = "5000"
+    biome.refresh()
+    habitat = biome.SELECTOV
+    with habitat.override(host=None):
+        assert biome.select("SELECTOV_*") == {"SELECTOV": {"PORT": 5000}}
+        assert "host" not in habitat
+    with habitat.override_context(host=None):
+        assert biome.select("SELECTOV_*") == {"SELECTOV": {"PORT": 5000}}
+    assert habitat.host == "dev.yourapp"
+
+
+def test_select_refresh():
+    os.environ["SELECTREF_DB_HOST"] = "db.local"
+    biome.refresh()
+    assert biome.select("SELECTREF_*_HOST") == {
+        "SELECTREF": {"DB_HOST": "db.local"},
+    }
+    os.environ["SELECTREF_EXTRA_HOST"] = "extra.local"
+    assert "EXTRA_HOST" not in biome.select("SELECTREF_*_HOST").SELECTREF
+    del os.environ["SELECTREF_DB_HOST"]
+    biome.refresh()
+    assert biome.select("SELECTREF_*_HOST") == {
+        "SELECTREF": {"EXTRA_HOST": "extra.local"},
+    }
+
+
+def test_select_namespaces():
+    os.environ["SELECTNS_APP_TIMEOUT"] = "45s"
+    os.environ["SELECTNS_APP_SIZE"] = "big"
+    os.environ["SELECTNS_OTHER_PORT"] = "5000"
+    os.environ["SELECTNSX_PORT"] = "6000"
+    biome.refresh()
+    biome.SELECTNS_APP.declare("timeout", "duration")
+    biome.SELECTNS_APP.declare("size", "bytes")
+    errors = {}
+    assert biome.select("SELECTNS*", errors) == {
+        "SELECTNS_APP": {"TIMEOUT": datetime.timedelta(seconds=45)},
+        "SELECTNS": {"OTHER_PORT": 5000},
+        "SELECTNSX": {"PORT": 6000},
+    }
+    assert set(errors) == {"SELECTNS_APP_SIZE"}
+    assert "SELECTNS" not in biome and "SELECTNSX" not in biome
+
+
+def test_load_cache(tmpdir):
+    os.environ["CACHEDAPP_PORT"] = "8000"
+    os.environ["CACHEDAPP_OPTIONS"] = "{'debug': True}"
+    cache_path = str(tmpdir.join("biome.cache"))
+    source = tmpdir.join("secrets.env")
+    source.write("SECRET=1")
+    assert not biome.load_cache(cache_path, ["cachedapp"], [str(source)])
+    assert biome.load_cache(cache_path, ["cachedapp"], [str(source)])
+    assert biome.CACHEDAPP.port == 8000
+    assert biome.CACHEDAPP.options.debug is True
+
+    os.environ["CACHEDAPP_PORT"] = "8001"
+    assert not biome.load_cache(cache_path, ["cachedapp"], [str(source)])
+    assert biome.CACHEDAPP.port == 8001
+
+    source.write("SECRET=22")
+    assert not biome.load_cache(cache_path, ["cachedapp"], [str(source)])
+    assert biome.load_cache(cache_path, ["cachedapp"], [str(source)])
+
+    tmpdir.join("biome.cache").write("garbage")
+    assert not biome.load_cache(cache_path, ["cachedapp"], [str(source)])
+
+
+def test_warm():
+    os.environ["WARMAPP_PORT"] = "8000"
+    os.environ["WARMAPP_SIZE"] = "big"
+    habitat = biome._lib.Habitat("warmapp", decoders={"size": "bytes"})
+    report = habitat.warm()
+    assert report.variables == 1
+    assert set(report.errors) == {"SIZE"}
+    assert habitat._cache == {"PORT": 8000}
+
+
+def test_prefetch(decoder_registry):
+    os.environ["PREFETCH1_A_SLOW"] = "1"
+    os.environ["PREFETCH2_A_SLOW"] = "2"
+    os.environ["PREFETCH3_A_SLOW"] = "3"
+    started = {"1": threading.Event(), "2": threading.Event()}
+    released = threading.Event()
+
+    def slow_decoder(value, name):
+        """Wait for the other namespace, or for the test to release."""
+        if value == "3":
+            released.wait(10)
+            return value
+        started[value].set()
+        other = started["2" if value == "1" else "1"]
+        if not other.wait(10):
+            raise RuntimeError("namespaces were not decoded concurrently")
+        return value
+
+    biome.register_decoder("slow", slow_decoder, "PREFETCH*_SLOW")
+    # Decoding only succeeds if both namespaces are decoded concurrently
+    reports = biome.prefetch(["prefetch1", "prefetch2"])
+    assert reports.PREFETCH1.done and reports.PREFETCH2.done
+    assert reports.PREFETCH1.errors == {} and reports.PREFETCH2.errors == {}
+    assert reports.PREFETCH1.error is None
+    assert reports.PREFETCH1.elapsed > 0
+    assert reports.PREFETCH1.variables == 1
+    assert biome.PREFETCH1._cache == {"A_SLOW": "1"}
+
+    reports = biome.prefetch(["prefetch3"], timeout=0.05)
+    released.set()
+    assert not reports.PREFETCH3.done
+    assert "PREFETCH3" not in biome
+
+
+def test_prefetch_existing(decoder_registry):
+    os.environ["PREFETCHX_TIMEOUT"] = "30s"
+    os.environ["PREFETCHX_SECRET"] = "/mnt/secret"
+    os.environ["PREFETCHY_PORT"] = "5000"
+
+    def failing_decoder(value, name):
+        """Fail like an unreachable network mount."""
+        raise OSError("mount unavailable")
+
+    biome.register_decoder("secret", failing_decoder, "PREFETCHX_SECRET")
+    habitat = biome.PREFETCHX
+    habitat.declare("timeout", "duration")
+    reports = biome.prefetch(["prefetchx", "prefetchy"])
+    assert biome.PREFETCHX is habitat
+    assert habitat.timeout == datetime.timedelta(seconds=30)
+    assert isinstance(reports.PREFETCHX.errors["SECRET"], OSError)
+    assert reports.PREFETCHX.variables == 1
+    assert reports.PREFETCHY.variables == 1
+
+
+def test_prefetch_load_error(monkeypatch):
+    warm = biome._lib.Habitat.warm
+
+    def failing_warm(habitat):
+        """Fail to load one of the namespaces."""
+        if habitat._prefix == "PREFETCHERR":
+            raise OSError("source unavailable")
+        return warm(habitat)
+
+    monkeypatch.setattr(biome._lib.Habitat, "warm", failing_warm)
+    reports = biome.prefetch(["prefetcherr", "prefetchok"])
+    assert isinstance(reports.PREFETCHERR.error, OSError)
+    assert reports.PREFETCHOK.done and reports.PREFETCHOK.error is None
+
+
+def test_override():
+    os.environ["OVERRIDE_HOST"] = "dev.yourapp"
+    os.environ["OVERRIDE_DEBUG"] = "false"
+    habitat = biome._lib.Habitat("override")
+    assert habitat.debug is False
+    with habitat.override(host="test.yourapp", port=8000, debug=None):
+        assert habitat.host == "test.yourapp"
+        assert habitat.port == 8000
+        assert "debug" not in habitat
+        with habitat.override(port="9000"):
+            assert habitat.get_int("port") == 9000
+        habitat.refresh()
+        assert habitat.host == "test.yourapp"
+        assert "debug" not in habitat
+        assert habitat.port == 8000
+        assert os.environ["OVERRIDE_HOST"] == "dev.yourapp"
+    assert habitat.host == "dev.yourapp"
+    assert habitat.debug is False
+    assert "port" not in habitat
+
+
+def test_override_context():
+    os.environ["OVERRIDECTX_HOST"] = "dev.yourapp"
+    habitat = biome._lib.Habitat("overridectx")
+    seen = []
+    with habitat.override_context(host="test.yourapp", port=8000):
+        thread = threading.Thread(target=lambda: seen.append(
+            (habitat.host, "port" in habitat)))
+        thread.start()
+        thread.join()
+        assert habitat.host == "test.yourapp"
+        assert habitat.get_int("port") == 8000
+        with habitat.override_context(host=None):
+            assert "host" not in habitat
+            assert habitat.port == 8000
+        assert habitat.host == "test.yourapp"
+    assert seen == [("dev.yourapp", False)]
+    assert habitat.host == "dev.yourapp"
+    assert "port" not in habitat
+
+
+def test_export():
+    os.environ["EXPORTAPP_HOST"] = "dev.yourapp"
+    os.environ["EXPORTAPP_GREETING"] = 'say "hi"\n'
+    os.environ["EXPORTAPP_PORT"] = "5000"
+    habitat = biome.EXPORTAPP
+    assert habitat.to_environ() == {
+        "EXPORTAPP_HOST": "dev.yourapp",
+        "EXPORTAPP_GREETING": 'say "hi"\n',
+        "EXPORTAPP_PORT": "5000",
+    }
+    with habitat.override_context(port=None, debug=True):
+        assert habitat.to_environ() == {
+            "EXPORTAPP_HOST": "dev.yourapp",
+            "EXPORTAPP_GREETING": 'say "hi"\n',
+            "EXPORTAPP_DEBUG": "True",
+        }
+    assert biome.export(["exportapp"]) == habitat.to_environ()
+    assert biome.export("exportapp", format="shell") == (
+        "export EXPORTAPP_GREETING='say \"hi\"\n'\n"
+        "export EXPORTAPP_HOST=dev.yourapp\n"
+        "export EXPORTAPP_PORT=5000\n"
+    )
+    assert biome.export("exportapp", format="dotenv") == (
+        'EXPORTAPP_GREETING="say \\"hi\\"\\n"\n'
+        'EXPORTAPP_HOST="dev.yourapp"\n'
+        'EXPORTAPP_PORT="5000"\n'
+    )
+    assert json.loads(biome.export("exportapp", format="json")) == \
+        habitat.to_environ()
+    with pytest.raises(ValueError):
+        biome.export("exportapp", format="yaml")
+
+
+def test_export_main():
+    os.environ["EXPORTMAIN_PORT"] = "5000"
+    output = subprocess.check_output([
+        sys.executable, "-m", "biome", "export", "exportmain",
+        "--format", "json",
+    ])
+    assert json.loads(output.decode("utf-8")) == {"EXPORTMAIN_PORT": "5000"}
+
+
+def test_interpolation():
+    os.environ["INTERP_DB_HOST"] = "db.local"
+    os.environ["INTERP_DB_PORT"] = "5432"
+    os.environ["INTERP_DB_ADDRESS"] = "${INTERP_DB_HOST}:${INTERP_DB_PORT}"
+    os.environ["INTERP_DB_URL"] = "postgres://${INTERP_DB_ADDRESS}/$${DB}"
+    os.environ["INTERP_DB_PORT_ALIAS"] = "${INTERP_DB_PORT}"
+    os.environ["INTERP_CACHE_URL"] = "redis://${INTERPOTHER_HOST}"
+    os.environ["INTERPOTHER_HOST"] = "cache.local"
+    habitat = biome._lib.Habitat("interp")
+    assert habitat.db_url == "postgres://${INTERP_DB_ADDRESS}/$${DB}"
+    habitat.enable_interpolation()
+    assert habitat.db_url == "postgres://db.local:5432/${DB}"
+    assert habitat.db_port_alias == 5432
+    assert habitat.cache_url == "redis://cache.local"
+
+    os.environ["INTERP_DB_HOST"] = "db2.local"
+    os.environ["INTERPOTHER_HOST"] = "cache2.local"
+    habitat.refresh()
+    assert "INTERP_DB_URL" not in habitat._expanded
+    assert "INTERP_DB_PORT_ALIAS" in habitat._expanded
+    assert habitat.db_url == "postgres://db2.local:5432/${DB}"
+    assert habitat.cache_url == "redis://cache2.local"
+
+    with habitat.override(db_port=6543):
+        assert habitat.db_url == "postgres://db2.local:6543/${DB}"
+    with habitat.override_context(db_host="db3.local"):
+        assert habitat.db_address == "db3.local:5432"
+    assert habitat.db_address == "db2.local:5432"
+
+
+def test_interpolation_errors():
+    os.environ["INTERPERR_A"] = "${INTERPERR_B}"
+    os.environ["INTERPERR_B"] = "x${INTERPERR_A}"
+    os.environ["INTERPERR_C"] = "${INTERPERR_MISSING}"
+    habitat = biome._lib.Habitat("interperr", interpolate=True)
+    with pytest.raises(biome._lib.InterpolationError) as excinfo:
+        habitat.a
+    assert "INTERPERR_A -> INTERPERR_B -> INTERPERR_A" in str(excinfo.value)
+    with pytest.raises(biome._lib.InterpolationError):
+        habitat.c
+    os.environ["INTERPERR_MISSING"] = "found"
+    habitat.refresh()
+    assert habitat.c == "found"
+
+
+def test_load_cache_unwritable(tmpdir):
+    os.environ["CACHEDRO_PORT"] = "8000"
+    cache_path = str(tmpdir.join("missing", "biome.cache"))
+    assert not biome.load_cache(cache_path, ["cachedro"])
+    assert biome.CACHEDRO.port == 8000
+    assert not tmpdir.join("missing").check()
+
+
+def test_load_cache_decoders(tmpdir, decoder_registry):
+    os.environ["CACHEDDEC_SIZE"] = "1"
+    os.environ["CACHEDDEC_TIMEOUT"] = "30s"
+    cache_path = str(tmpdir.join("biome.cache"))
+    biome.register_decoder("sz", lambda value, name: 1, "CACHEDDEC_SIZE")
+    biome.CACHEDDEC.declare("timeout", "duration")
+    assert not biome.load_cache(cache_path, ["cacheddec"])
+    assert biome.load_cache(cache_path, ["cacheddec"])
+    assert biome.CACHEDDEC.size == 1
+    assert biome.CACHEDDEC.timeout == datetime.timedelta(seconds=30)
+
+    biome.register_decoder("sz", lambda value, name: 2, "CACHEDDEC_SIZE")
+    assert not biome.load_cache(cache_path, ["cacheddec"])
+    assert biome.CACHEDDEC.size == 2
+
+    biome.CACHEDDEC.declare("timeout", "str")
+    assert not biome.load_cache(cache_path, ["cacheddec"])
+    assert biome.CACHEDDEC.timeout == "30s"
+
+
+def test_interpolation_external_overrides():
+    os.environ["INTERPA_URL"] = "http://${INTERPB_HOST}:${INTERPB_PORT}"
+    os.environ["INTERPB_HOST"] = "orig"
+    os.environ["INTERPB_PORT"] = "80"
+    biome.INTERPA.enable_interpolation()
+    other = biome.INTERPB
+    assert biome.INTERPA.url == "http://orig:80"
+    with other.override(host="new"):
+        assert biome.INTERPA.url == "http://new:80"
+        with other.override_context(port=8080):
+            assert biome.INTERPA.url == "http://new:8080"
+        assert biome.INTERPA.url == "http://new:80"
+    assert biome.INTERPA.url == "http://orig:80"
+    assert "INTERPB_HOST" in biome.INTERPA._external
+
+
+def test_load_cache_override_context(tmpdir):
+    os.environ["CACHEDCTX_PORT"] = "8000"
+    cache_path = str(tmpdir.join("biome.cache"))
+    with biome.CACHEDCTX.override_context(port=1):
+        assert not biome.load_cache(cache_path, ["cachedctx"])
+        assert biome.CACHEDCTX.port == 1
+    assert biome.load_cache(cache_path, ["cachedctx"])
+    assert biome.CACHEDCTX.port == 8000
+
+
+def scale_decoder(factor, value, name):
+    """Decode an integer multiplied by a factor."""
+    return factor * int(value)
+
+
+def test_load_cache_decoder_arguments(tmpdir):
+    os.environ["CACHEDARG_SIZE"] = "3"
+    os.environ["CACHEDARG_COUNT"] = "4"
+    cache_path = str(tmpdir.join("biome.cache"))
+    habitat = biome.CACHEDARG
+    habitat.declare("size", functools.partial(scale_decoder, 2))
+
+    def make_decoder(factor):
+        return lambda value, name: factor * int(value)
+
+    habitat.declare("count", make_decoder(2))
+    assert not biome.load_cache(cache_path, ["cachedarg"])
+    assert biome.load_cache(cache_path, ["cachedarg"])
+    assert (habitat.size, habitat.count) == (6, 8)
+
+    habitat.declare("size", functools.partial(scale_decoder, 10))
+    assert not biome.load_cache(cache_path, ["cachedarg"])
+    assert habitat.size == 30
+    habitat.declare("count", make_decoder(10))
+    assert not biome.load_cache(cache_path, ["cachedarg"])
+    assert habitat.count == 40
+
+
+def test_load_cache_unidentifiable_decoder(tmpdir):
+    os.environ["CACHEDOBJ_SIZE"] = "3"
+    cache_path = str(tmpdir.join("biome.cache"))
+
+    class Scale(object):
+        factor = 2
+
+        def decode(self, value, name):
+            return self.factor * int(value)
+
+    scale = Scale()
+    biome.CACHEDOBJ.declare("size", scale.decode)
+    assert not biome.load_cache(cache_path, ["cachedobj"])
+    assert biome.load_cache(cache_path, ["cachedobj"])
+    scale.factor = 10
+    assert biome.CACHEDOBJ.size == 30
+
+
+def test_interpolation_external_snapshot():
+    os.environ["INTERPC_URL"] = "http://${INTERPD_HOST}"
+    os.environ["INTERPC_NAME"] = "${INTERPE_NAME}"
+    os.environ["INTERPD_HOST"] = "orig"
+    os.environ["INTERPE_NAME"] = "orig"
+    habitat = biome.INTERPC
+    habitat.enable_interpolation()
+    other = biome.INTERPD
+    assert (habitat.url, habitat.name) == ("http://orig", "orig")
+
+    os.environ["INTERPD_HOST"] = "new"
+    os.environ["INTERPE_NAME"] = "new"
+    assert (habitat.url, habitat.name) == ("http://orig", "orig")
+    other.refresh()
+    assert habitat.url == "http://new"
+    assert habitat.name == "orig"
+    habitat.refresh()
+    assert habitat.name == "new"
+
+    other["HOST"] = "assigned"
+    assert habitat.url == "http://assigned"